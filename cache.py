@@ -0,0 +1,48 @@
+"""
+Polymarket 市场数据磁盘缓存
+"""
+import hashlib
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import config
+from storage import load_json, write_json_atomic
+
+
+class FileCache:
+    """每个条目一个 JSON 文件: {data, fetched_at}
+
+    已关闭 (closed) 的市场不会再变化，永久有效；其余条目超过 ttl 秒后失效。
+    """
+
+    def __init__(self, directory: Path, ttl: float):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{hashlib.md5(key.encode('utf-8')).hexdigest()}.json"
+
+    def get(self, key: str) -> Optional[Dict]:
+        """命中且未过期时返回缓存数据，否则返回 None"""
+        try:
+            entry = load_json(self._path(key))
+        except (OSError, ValueError):
+            return None
+        data = entry.get('data')
+        if not isinstance(data, dict):
+            return None
+        if data.get('closed') or time.time() - entry.get('fetched_at', 0) < self.ttl:
+            return data
+        return None
+
+    def set(self, key: str, data: Dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(self._path(key), {'data': data, 'fetched_at': time.time()})
+
+
+def market_key(market_id) -> str:
+    return f"market:{market_id}"
+
+
+MARKET_CACHE = FileCache(config.MARKET_CACHE_DIR, config.MARKET_CACHE_TTL)
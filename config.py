@@ -26,13 +26,23 @@ MAX_HOURS_UNTIL_END = 4   # 结束时间在 4 小时内
 MIN_VOLUME = 1000         # 最小交易量
 MAX_FEE = 0.0            # 最大手续费 (0 = 无手续费)
 
+# 排除的 crypto 市场关键词 (不区分大小写，按整词匹配)
+CRYPTO_KEYWORDS = ['bitcoin', 'btc', 'ethereum', 'eth', 'solana', 'xrp', 'up or down']
+
 # 交易参数
 TRADE_AMOUNT = 5        # 每个市场花费 $5 (最小)
 MIN_PROFIT_MARGIN = 0.02 # 最小利润空间
 
 # 文件路径
-TRADES_FILE = DATA_DIR / "trades.json"
+TRADES_FILE = DATA_DIR / "trades.json"        # 旧版单文件记录，仅用于迁移
+TRADES_LOG = DATA_DIR / "trades.ndjson"       # 运行记录，追加写入
+AGGREGATE_FILE = DATA_DIR / "aggregate.json"  # 累计统计与结算索引
 LOG_FILE = DATA_DIR / "scanner.log"
+FSYNC_WRITES = False  # 交易记录写入后是否 fsync (更耐断电，但更慢)
+
+# 市场数据缓存 (已关闭市场永久有效)
+MARKET_CACHE_DIR = PROJECT_DIR / ".cache" / "markets"
+MARKET_CACHE_TTL = 300    # 未关闭市场缓存 5 分钟
 
 # 运行间隔 (秒)
 SCAN_INTERVAL = 3600      # 1小时
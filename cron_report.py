@@ -1,46 +1,31 @@
 #!/usr/bin/env python3
 """Cron 任务报告脚本 - 包含结算状态"""
-import json
-import requests
 import sys
-from pathlib import Path
+import config
+from http_client import get_markets
+from storage import load_trades, unresolved_trades
 
-API_URL = "https://gamma-api.polymarket.com/markets"
-TRADES_FILE = Path("data/trades.json")
 
-def check_settlements():
+def check_settlements(data):
     """检查结算状态"""
-    if not TRADES_FILE.exists():
+    # 未结算交易 (按 market_id 去重)
+    unique = unresolved_trades(data)
+    if not unique:
         return {'resolved': [], 'unresolved': [], 'newly_resolved': []}
     
-    with open(TRADES_FILE) as f:
-        data = json.load(f)
-    
-    # 收集未结算交易
-    all_trades = []
-    for run in data.get('runs', []):
-        for t in run.get('executed_trades', []):
-            if not t.get('settled'):
-                all_trades.append(t)
-    
-    if not all_trades:
-        return {'resolved': [], 'unresolved': [], 'newly_resolved': []}
-    
-    # 去重
-    unique = {}
-    for t in all_trades:
-        mid = t.get('market_id')
-        if mid and mid not in unique:
-            unique[mid] = t
-    
     resolved = []
     unresolved = []
     newly = []
     
+    # 按批并发查询
+    markets = get_markets(unique)
+    
     for mid, trade in unique.items():
+        m = markets.get(str(mid))
+        if m is None:
+            unresolved.append(trade)
+            continue
         try:
-            resp = requests.get(f"{API_URL}/{mid}", timeout=10)
-            m = resp.json()
             if m.get('closed'):
                 res = m.get('resolution')
                 if res and str(res) != 'null':
@@ -59,8 +44,7 @@ def check_settlements():
     return {'resolved': resolved, 'unresolved': unresolved, 'newly_resolved': newly}
 
 # 加载数据
-with open(TRADES_FILE) as f:
-    d = json.load(f)
+d = load_trades(config.TRADES_LOG, config.AGGREGATE_FILE, config.TRADES_FILE)
 
 runs = d.get('runs', [])
 if not runs:
@@ -73,7 +57,7 @@ scan = latest.get('scan_info', {})
 summary = latest.get('summary', {})
 
 # 结算状态
-settlement = check_settlements()
+settlement = check_settlements(d)
 
 # 构建消息
 msg = f"""📊 Polymarket 扫描报告
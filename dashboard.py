@@ -1,35 +1,127 @@
 """
 Polymarket 套利策略 - Web 仪表板 (完整版)
 """
-import json
+import gzip
+import hashlib
 import http.server
-import socketserver
+import os
+import socket
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, fields
+from html import escape
 from pathlib import Path
+from string import Template
 import config
-from datetime import datetime, timezone
+from storage import RunLog, build_aggregate, load_json, load_state, is_win, format_local_time
 
-PORT = 80
-TRADES_FILE = config.DATA_DIR / "trades.json"
+PORT = int(os.environ.get('DASHBOARD_PORT', 8080))
+SD_LISTEN_FDS_START = 3  # systemd 传入的第一个监听 socket
+PAGE_SIZE = 20  # 每页显示的运行次数
+TRADES_LOG = config.TRADES_LOG
+AGGREGATE_FILE = config.AGGREGATE_FILE
+TRADES_FILE = config.TRADES_FILE  # 旧版记录，尚未迁移时使用
+
+# 静态样式，带版本号长期缓存
+CSS_BYTES = (config.PROJECT_DIR / "static" / "app.css").read_bytes()
+CSS_VERSION = hashlib.md5(CSS_BYTES).hexdigest()[:12]
+
+# 页面模板，启动时加载一次；整页在 ${runs} 处拆成头尾两段以便逐段输出
+TEMPLATE_DIR = config.PROJECT_DIR / "templates"
+_TEMPLATES = {p.stem: Template(p.read_text(encoding='utf-8')) for p in TEMPLATE_DIR.glob('*.html')}
+_head, _foot = _TEMPLATES.pop('dashboard').template.split('${runs}')
+_TEMPLATES.update(head=Template(_head), foot=Template(_foot))
+
+@dataclass(slots=True, frozen=True)
+class TradeView:
+    """页面渲染用的交易行 (计划交易与执行交易共用)"""
+    market_id: str = ''
+    question: str = ''
+    outcome: str = ''
+    price: float = 0.0
+    amount: float = 0.0
+    cost: float = 0.0
+    created_at: str = ''
+    end_date: str = ''
+    settled: bool = False
+    resolution: str = ''
+    
+    @classmethod
+    def from_dict(cls, t):
+        return cls(**{k: t[k] for k in _VIEW_FIELDS if t.get(k) is not None})
+
+_VIEW_FIELDS = tuple(f.name for f in fields(TradeView))
+
+# 解析结果缓存，记录文件变化后增量更新
+_LOG = RunLog(TRADES_LOG)
+_LOCK = threading.Lock()
+_CACHE = {'version': None, 'stats': None, 'html_by_page': {},
+          'views': [], 'by_date': {}, 'dates': []}
+
+def _data_version():
+    """各记录文件的大小与修改时间，任一变化即需重新加载"""
+    parts = []
+    for path in (TRADES_LOG, AGGREGATE_FILE, TRADES_FILE):
+        st = path.stat() if path.exists() else None
+        parts.append(f"{st.st_size}.{st.st_mtime_ns}" if st else '0')
+    return hashlib.md5('-'.join(parts).encode()).hexdigest()[:16]
+
+def _fill_view(view, r):
+    """运行记录转为渲染用视图，交易行转为 TradeView"""
+    view.update(
+        local_time=r.get('local_time') or format_local_time(r.get('timestamp', '')),
+        scan_info=r.get('scan_info', {}),
+        planned_count=len(r.get('planned_trades', [])),
+        planned_trades=[TradeView.from_dict(p) for p in r.get('planned_trades', [])[:5]],
+        executed_trades=[TradeView.from_dict(t) for t in r.get('executed_trades', [])]
+    )
+    return view
 
 def load_data():
-    if TRADES_FILE.exists():
-        with open(TRADES_FILE, 'r') as f:
-            return json.load(f)
-    return {"runs": []}
+    """重新加载变化的记录；调用方需持有 _LOCK"""
+    version = _data_version()
+    if version == _CACHE['version']:
+        return
+    
+    if TRADES_LOG.exists():
+        first, changed = _LOG.refresh()
+        runs = _LOG.runs
+        state = load_state(AGGREGATE_FILE)
+    else:
+        state = load_json(TRADES_FILE) if TRADES_FILE.exists() else {}
+        runs = state.get('runs', [])
+        first, changed = 0, set()
+    
+    views, by_date = _CACHE['views'], _CACHE['by_date']
+    if first != len(views) or first == 0:
+        views, by_date, first = [], defaultdict(list), 0
+    
+    # 被结算事件修改的旧运行只重建视图
+    for i in changed:
+        if i < first:
+            _fill_view(views[i], runs[i])
+    
+    # 新运行按日期 (YYYY-MM-DD) 分桶，保持时间顺序
+    for r in runs[first:]:
+        view = _fill_view({}, r)
+        views.append(view)
+        if r.get('timestamp'):
+            by_date[r['timestamp'][:10]].append(view)
+    
+    # 统计文件落后于日志时 (结算已追加、统计未保存) 按运行记录重算
+    aggregate = state.get('aggregate') if state.get('log_offset') == _LOG.offset else None
+    stats = calculate_stats({'runs': runs, 'aggregate': aggregate})
+    _CACHE.update(version=version, stats=stats, html_by_page={},
+                  views=views, by_date=by_date, dates=sorted(by_date, reverse=True))
 
 def calculate_stats(data):
     runs = data.get('runs', [])
     
-    all_trades = [t for run in runs for t in run.get('executed_trades', [])]
-    
-    # 分类统计
-    pending_trades = [t for t in all_trades if not t.get('settled')]
-    cancelled_trades = [t for t in all_trades if t.get('resolution') == 'CANCELLED']
-    settled_trades = [t for t in all_trades if t.get('settled') and t.get('resolution') != 'CANCELLED']
-    
-    pending_cost = sum(t.get('cost', 0) for t in pending_trades)
-    pending_payout = sum(t.get('amount', 0) for t in pending_trades)  # 股数
-    cancelled_cost = sum(t.get('cost', 0) for t in cancelled_trades)
+    # 优先使用 TradeRecorder 维护的累计统计，旧记录按每次运行的汇总计算
+    aggregate = data.get('aggregate') or build_aggregate(runs)
+    counts = aggregate['counts']
+    pending_cost = aggregate['pending_cost']
+    pending_payout = aggregate['pending_payout']
     
     # 当前余额 = 虚拟余额 - 待结算投入 (取消的已退款)
     actual_balance = config.VIRTUAL_BALANCE - pending_cost
@@ -37,323 +129,263 @@ def calculate_stats(data):
     # 潜在利润 = 待结算的潜在回报 - 待结算投入
     potential_profit = pending_payout - pending_cost
     
-    # 实际盈利（已结算赢的）
-    actual_profit = sum(t.get('profit', 0) for t in settled_trades if t.get('profit', 0) > 0)
-    
     # ROI = 潜在利润 / 待结算投入
     roi = (potential_profit / pending_cost * 100) if pending_cost > 0 else 0
     
     return {
         'balance': actual_balance,
-        'total_invested': sum(t.get('cost', 0) for t in all_trades),
+        'total_invested': aggregate['total_invested'],
         'pending_cost': pending_cost,
-        'cancelled_cost': cancelled_cost,
+        'cancelled_cost': aggregate['cancelled_cost'],
         'potential_payout': pending_payout,
         'potential_profit': potential_profit,
-        'actual_profit': actual_profit,
-        'total_runs': len(runs),
-        'total_trades': len(all_trades),
-        'settled': len(settled_trades),
-        'cancelled': len(cancelled_trades),
-        'pending': len(pending_trades),
+        'actual_profit': aggregate['actual_profit'],
+        'total_runs': counts['runs'],
+        'total_trades': counts['trades'],
+        'settled': counts['settled'],
+        'cancelled': counts['cancelled'],
+        'pending': counts['pending'],
         'roi': roi
     }
 
 class Handler(http.server.SimpleHTTPRequestHandler):
+    # 保持连接，所有响应都带 Content-Length
+    protocol_version = 'HTTP/1.1'
+    
     def do_GET(self):
         path = self.path.split('?')[0]
         
         if path == '/' or path == '/index.html':
             # 获取查询参数
-            from urllib.parse import parse_qs
+            from urllib.parse import parse_qs, quote
             query = parse_qs(self.path.split('?')[1] if '?' in self.path else '')
             
             # 筛选日期
             date_filter = query.get('date', [''])[0]
+            try:
+                page = max(int(query.get('page', ['0'])[0]), 0)
+            except ValueError:
+                page = 0
+            key = (date_filter, page)
             
-            data = load_data()
-            stats = calculate_stats(data)
-            runs = data.get('runs', [])
-            
-            # 日期筛选
-            if date_filter:
-                filtered_runs = [r for r in runs if r.get('timestamp', '').startswith(date_filter)]
-            else:
-                filtered_runs = runs
+            # 命中缓存时直接返回编码 (及压缩) 后的页面
+            cached = None
+            if _data_version() == _CACHE['version']:
+                cached = _CACHE['html_by_page'].get(key)
+            if cached is None:
+                with _LOCK:
+                    cached = self.render_page(date_filter, page)
             
-            html = self.generate_html(stats, filtered_runs)
+            # ETag 用页面渲染时的数据版本，避免与并发重载后的新版本错配
+            plain, compressed, version = cached
+            use_gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+            body = compressed if use_gzip else plain
+            etag = f'"{version}-{quote(date_filter)}-{page}{"-gz" if use_gzip else ""}"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Vary', 'Accept-Encoding')
+                self.end_headers()
+                return
             
             self.send_response(200)
             self.send_header('Content-type', 'text/html; charset=utf-8')
+            if use_gzip:
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.send_header('Vary', 'Accept-Encoding')
             self.end_headers()
-            self.wfile.write(html.encode('utf-8'))
+            self.wfile.write(body)
+        elif path == '/static/app.css':
+            self._serve_static(CSS_BYTES, 'text/css; charset=utf-8', CSS_VERSION)
         else:
             self.send_response(404)
+            self.send_header('Content-Length', '0')
             self.end_headers()
     
-    def generate_html(self, stats, runs):
-        # 生成日期选项
-        dates = sorted(set(r.get('timestamp', '')[:10] for r in runs if r.get('timestamp')), reverse=True)
-        
-        html = f'''<!DOCTYPE html>
-<html lang="zh">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Polymarket 套利策略监控</title>
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Arial; background: #0f0f23; color: #fff; padding: 20px; }}
-        .container {{ max-width: 1200px; margin: 0 auto; }}
-        
-        h1 {{ text-align: center; margin-bottom: 20px; color: #4ade80; }}
-        h2 {{ margin: 25px 0 15px; padding-bottom: 10px; border-bottom: 1px solid #333; }}
-        
-        /* 搜索表单 */
-        .search-box {{ background: #1a1a3e; padding: 15px; border-radius: 10px; margin-bottom: 20px; }}
-        .search-box input, .search-box button {{ padding: 10px; border-radius: 5px; border: none; }}
-        .search-box input {{ background: #2a2a4e; color: #fff; width: 200px; }}
-        .search-box button {{ background: #4ade80; color: #000; cursor: pointer; margin-left: 10px; }}
+    def render_page(self, date_filter, page):
+        """渲染并缓存页面，返回 (原始字节, gzip 字节, 数据版本)"""
+        load_data()
+        key = (date_filter, page)
+        if key in _CACHE['html_by_page']:
+            return _CACHE['html_by_page'][key]
         
-        /* 统计卡片 */
-        .stats-grid {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(150px, 1fr)); gap: 15px; margin-bottom: 30px; }}
-        .stat-card {{ background: #1a1a3e; padding: 20px; border-radius: 10px; text-align: center; }}
-        .stat-value {{ font-size: 24px; font-weight: bold; margin: 10px 0; }}
-        .stat-label {{ color: #888; font-size: 12px; }}
-        .positive {{ color: #4ade80; }}
-        
-        /* 交易记录 */
-        .run-item {{ background: #1a1a3e; border-radius: 10px; margin-bottom: 20px; overflow: hidden; }}
-        .run-header {{ background: #2a2a5e; padding: 15px; display: flex; justify-content: space-between; align-items: center; }}
-        .run-time {{ color: #4ade80; }}
-        .run-stats {{ color: #888; font-size: 14px; }}
-        
-        /* 市场表格 */
-        .market-table {{ width: 100%; border-collapse: collapse; }}
-        .market-table th, .market-table td {{ padding: 12px; text-align: left; border-bottom: 1px solid #333; }}
-        .market-table th {{ background: #252545; color: #888; font-weight: normal; font-size: 12px; }}
-        .market-table tr:hover {{ background: #1a1a3e; }}
-        
-        .price {{ font-weight: bold; }}
-        .price-high {{ color: #4ade80; }}
-        .price-low {{ color: #f87171; }}
+        # 日期筛选
+        if date_filter:
+            filtered_runs = _CACHE['by_date'].get(date_filter, [])
+        else:
+            filtered_runs = _CACHE['views']
         
-        .outcome {{ padding: 3px 10px; border-radius: 3px; font-size: 12px; font-weight: bold; }}
-        .outcome-YES {{ background: #4ade80; color: #000; }}
-        .outcome-NO {{ background: #f87171; color: #000; }}
+        # 分页 (最新的在第 0 页)
+        pages = max((len(filtered_runs) + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+        end = len(filtered_runs) - page * PAGE_SIZE
+        page_runs = filtered_runs[max(end - PAGE_SIZE, 0):max(end, 0)]
         
-        .section-markets {{ padding: 15px; }}
-        .section-trades {{ padding: 15px; }}
+        html = self.generate_html(_CACHE['stats'], page_runs, _CACHE['dates'],
+                                  pager=self.render_pager(date_filter, page, pages))
+        body = html.encode('utf-8')
+        cached = (body, gzip.compress(body, compresslevel=6), _CACHE['version'])
+        # 只缓存存在的日期和页码，避免任意参数撑大缓存
+        if (not date_filter or date_filter in _CACHE['by_date']) and page < pages:
+            _CACHE['html_by_page'][key] = cached
+        return cached
+    
+    def _serve_static(self, body, content_type, version):
+        etag = f'"{version}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'public, max-age=86400, immutable')
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def generate_html(self, stats, runs, dates, pager='', write=None):
+        """生成页面；传入 write 时逐段输出，否则返回拼接后的字符串"""
+        if write is None:
+            parts = []
+            self.generate_html(stats, runs, dates, pager, parts.append)
+            return ''.join(parts)
         
-        .filter-info {{ background: #252545; padding: 10px 15px; margin: 10px 15px; border-radius: 5px; font-size: 13px; color: #888; }}
+        write(_TEMPLATES['head'].substitute(
+            css_version=CSS_VERSION,
+            balance=f"{stats['balance']:.2f}",
+            total_invested=f"{stats['total_invested']:.2f}",
+            pending_cost=f"{stats['pending_cost']:.2f}",
+            cancelled_cost=f"{stats['cancelled_cost']:.2f}",
+            potential_payout=f"{stats['potential_payout']:.2f}",
+            potential_profit=f"{stats['potential_profit']:.2f}",
+            total_runs=stats['total_runs'],
+            total_trades=stats['total_trades'],
+            pending=stats['pending'],
+            cancelled=stats['cancelled'],
+            settled=stats['settled'],
+            actual_profit=f"{stats['actual_profit']:.2f}",
+            roi=f"{stats['roi']:.2f}",
+            date_links=''.join(_TEMPLATES['date_link'].substitute(date=escape(d)) for d in dates[:10])
+        ))
         
-        /* 日期导航 */
-        .date-nav {{ display: flex; gap: 10px; margin-bottom: 20px; flex-wrap: wrap; }}
-        .date-btn {{ padding: 8px 16px; background: #1a1a3e; color: #fff; border: none; border-radius: 5px; cursor: pointer; text-decoration: none; }}
-        .date-btn:hover, .date-btn.active {{ background: #4ade80; color: #000; }}
+        # 按时间倒序显示每次搜索结果
+        for run in reversed(runs):
+            write(self.render_run(run))
         
-        .refresh {{ text-align: center; margin-top: 30px; }}
-        .refresh a {{ color: #4ade80; text-decoration: none; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>📈 Polymarket 套利策略监控</h1>
+        write(_TEMPLATES['foot'].substitute(pager=pager))
+    
+    def render_pager(self, date_filter, page, pages):
+        """上一页/下一页链接，只有一页时为空"""
+        from urllib.parse import urlencode
+        if pages <= 1:
+            return ''
         
-        <!-- 钱包状态 -->
-        <h2>💰 钱包状态</h2>
-        <div class="stats-grid">
-            <div class="stat-card">
-                <div class="stat-label">虚拟余额</div>
-                <div class="stat-value">${stats['balance']:.2f}</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-label">总投入</div>
-                <div class="stat-value">${stats['total_invested']:.2f}</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-label">待结算</div>
-                <div class="stat-value" style="color:#fbbf24">${stats['pending_cost']:.2f}</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-label">已退款</div>
-                <div class="stat-value">${stats['cancelled_cost']:.2f}</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-label">潜在回报</div>
-                <div class="stat-value positive">${stats['potential_payout']:.2f}</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-label">潜在利润</div>
-                <div class="stat-value positive">${stats['potential_profit']:.2f}</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-label">运行次数</div>
-                <div class="stat-value">{stats['total_runs']}</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-label">交易笔数</div>
-                <div class="stat-value">{stats['total_trades']}</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-label">待/取消/已结</div>
-                <div class="stat-value">{stats['pending']}/{stats['cancelled']}/{stats['settled']}</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-label">实际盈利</div>
-                <div class="stat-value">${stats['actual_profit']:.2f}</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-label">ROI</div>
-                <div class="stat-value positive">{stats['roi']:.2f}%</div>
-            </div>
-        </div>
+        def link(n, label):
+            params = {'date': date_filter} if date_filter else {}
+            if n:
+                params['page'] = n
+            href = f"/?{urlencode(params)}" if params else '/'
+            return f'            <a href="{escape(href)}" class="date-btn">{label}</a>\n'
         
-        <!-- 日期筛选 -->
-        <h2>📅 历史记录</h2>
-        <div class="date-nav">
-            <a href="/" class="date-btn">全部</a>
-'''
+        links = ''
+        if page > 0:
+            links += link(min(page, pages) - 1, '上一页')
+        links += f'            <span class="pager-info">{min(page + 1, pages)} / {pages}</span>\n'
+        if page + 1 < pages:
+            links += link(page + 1, '下一页')
+        return _TEMPLATES['pager'].substitute(links=links)
+    
+    def render_run(self, run):
+        planned = run.get('planned_trades', [])
+        executed = run.get('executed_trades', [])
         
-        for d in dates[:10]:
-            html += f'            <a href="/?date={d}" class="date-btn">{d}</a>\n'
+        # 扫描统计
+        scan_info = run.get('scan_info', {})
         
-        html += '''        </div>
-'''
+        # 搜索结果
+        markets = ''
+        if planned:
+            rows = []
+            for p in planned:
+                rows.append(_TEMPLATES['market_row'].substitute(
+                    outcome=escape(p.outcome),
+                    question=escape(p.question[:50]),
+                    price=f"{p.price:.4f}",
+                    prob=f"{p.price * 100:.1f}",
+                    market_id=escape(str(p.market_id))
+                ))
+            markets = _TEMPLATES['markets'].substitute(
+                max_hours=config.MAX_HOURS_UNTIL_END,
+                min_prob=f"{config.MIN_PROBABILITY*100:.0f}",
+                max_prob=f"{config.MAX_PROBABILITY*100:.0f}",
+                count=run['planned_count'],
+                rows=''.join(rows)
+            )
         
-        # 按时间倒序显示每次搜索结果
-        for run in reversed(runs):
-            timestamp = run.get('timestamp', '')
-            summary = run.get('summary', {})
-            planned = run.get('planned_trades', [])
-            executed = run.get('executed_trades', [])
-            
-            # 格式化时间
-            try:
-                dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                local_time = dt.strftime('%Y-%m-%d %H:%M:%S')
-            except:
-                local_time = timestamp
-            
-            # 扫描统计
-            scan_info = run.get('scan_info', {})
-            
-            html += f'''
-        <div class="run-item">
-            <div class="run-header">
-                <div class="run-time">🕐 {local_time}</div>
-                <div class="run-stats">
-                    API返回 {scan_info.get('total_api', 0)} 市场 | 
-                    过滤crypto后 {scan_info.get('non_crypto', 0)} | 
-                    符合条件 {scan_info.get('filtered', 0)} 个
-                </div>
-            </div>
-'''
-            
-            # 搜索结果
-            if planned:
-                html += f'''
-            <div class="filter-info">
-                筛选条件: 结束时间≤{config.MAX_HOURS_UNTIL_END}小时, 概率{config.MIN_PROBABILITY*100:.0f}-{config.MAX_PROBABILITY*100:.0f}%, 
-                交易量>$50K, 流动性>$10K, 创建时间>1小时
-            </div>
-            <div class="section-markets">
-                <h3>🔍 搜索结果 (符合条件 {len(planned)} 个)</h3>
-                <table class="market-table">
-                    <tr>
-                        <th>交易</th>
-                        <th>名称</th>
-                        <th>价格</th>
-                        <th>概率</th>
-                        <th>Market ID</th>
-                    </tr>
-'''
-                for p in planned[:5]:
-                    outcome = p.get('outcome', '')
-                    price = p.get('price', 0)
-                    prob = price * 100
-                    question = p.get('question', '')[:50]
-                    market_id = p.get('market_id', '')
-                    
-                    html += f'''                    <tr>
-                        <td><span class="outcome outcome-{outcome}">{outcome}</span></td>
-                        <td>{question}</td>
-                        <td class="price price-{outcome}">${price:.4f}</td>
-                        <td>{prob:.1f}%</td>
-                        <td>{market_id}</td>
-                    </tr>
-'''
-                html += '''                </table>
-            </div>
-'''
-            
-            # 执行交易
-            if executed:
-                html += f'''
-            <div class="section-trades">
-                <h3>📋 执行交易 ({len(executed)} 笔)</h3>
-                <table class="market-table">
-                    <tr>
-                        <th>交易</th>
-                        <th>名称</th>
-                        <th>买入价</th>
-                        <th>股数</th>
-                        <th>花费</th>
-                        <th>创建时间</th>
-                        <th>结束时间</th>
-                        <th>状态</th>
-                    </tr>
-'''
-                for t in executed:
-                    outcome = t.get('outcome', '')
-                    price = t.get('price', 0)
-                    amount = t.get('amount', 0)
-                    cost = t.get('cost', 0)
-                    question = t.get('question', '')[:35]
-                    end_date = t.get('end_date', '')[:16].replace('T', ' ')
-                    created_at = t.get('created_at', '')[:16].replace('T', ' ') if t.get('created_at') else ''
-                    settled = t.get('settled', False)
-                    resolution = t.get('resolution', '')
-                    
-                    # 结算状态
-                    if settled:
-                        if resolution == 'CANCELLED':
-                            status = '<span style="color:#f87171">已取消</span>'
-                        else:
-                            win = (outcome == 'YES' and resolution == 'Yes') or (outcome == 'NO' and resolution == 'No')
-                            status = '<span style="color:#4ade80">✅赢</span>' if win else '<span style="color:#f87171">❌输</span>'
+        # 执行交易
+        trades = ''
+        if executed:
+            rows = []
+            for t in executed:
+                # 结算状态
+                if t.settled:
+                    if t.resolution == 'CANCELLED':
+                        status = '<span style="color:#f87171">已取消</span>'
+                    elif is_win(t.outcome, t.resolution):
+                        status = '<span style="color:#4ade80">✅赢</span>'
                     else:
-                        status = '<span style="color:#888">⏳待结算</span>'
-                    
-                    html += f'''                    <tr>
-                        <td><span class="outcome outcome-{outcome}">{outcome}</span></td>
-                        <td>{question}</td>
-                        <td>${price:.4f}</td>
-                        <td>{amount:.2f}</td>
-                        <td>${cost:.2f}</td>
-                        <td>{created_at}</td>
-                        <td>{end_date}</td>
-                        <td>{status}</td>
-                    </tr>
-'''
-                html += '''                </table>
-            </div>
-'''
-            
-            html += '''        </div>
-'''
+                        status = '<span style="color:#f87171">❌输</span>'
+                else:
+                    status = '<span style="color:#888">⏳待结算</span>'
+                
+                rows.append(_TEMPLATES['trade_row'].substitute(
+                    outcome=escape(t.outcome),
+                    question=escape(t.question[:35]),
+                    price=f"{t.price:.4f}",
+                    amount=f"{t.amount:.2f}",
+                    cost=f"{t.cost:.2f}",
+                    created_at=escape(t.created_at[:16].replace('T', ' ')),
+                    end_date=escape(t.end_date[:16].replace('T', ' ')),
+                    status=status
+                ))
+            trades = _TEMPLATES['trades'].substitute(count=len(executed), rows=''.join(rows))
         
-        html += '''
-        <div class="refresh">
-            <a href="/">🔄 刷新页面</a>
-        </div>
-    </div>
-</body>
-</html>'''
-        return html
+        return _TEMPLATES['run'].substitute(
+            local_time=escape(run['local_time']),
+            total_api=scan_info.get('total_api', 0),
+            non_crypto=scan_info.get('non_crypto', 0),
+            filtered=scan_info.get('filtered', 0),
+            markets=markets,
+            trades=trades
+        )
+
+def make_server():
+    """创建服务；由 systemd socket 激活时直接使用传入的监听 socket"""
+    if os.environ.get('LISTEN_FDS') and os.environ.get('LISTEN_PID') in (None, str(os.getpid())):
+        httpd = http.server.ThreadingHTTPServer(("0.0.0.0", PORT), Handler, bind_and_activate=False)
+        httpd.socket.close()
+        httpd.socket = socket.socket(fileno=SD_LISTEN_FDS_START)
+        httpd.server_address = httpd.socket.getsockname()[:2]
+        httpd.server_name, httpd.server_port = socket.getfqdn(), httpd.server_address[1]
+        return httpd
+    return http.server.ThreadingHTTPServer(("0.0.0.0", PORT), Handler)
+
+def drop_privileges():
+    """以 root 绑定端口后，切换到 DASHBOARD_USER 指定的用户运行"""
+    user = os.environ.get('DASHBOARD_USER')
+    if not user or os.getuid() != 0:
+        return
+    import pwd
+    pw = pwd.getpwnam(user)
+    os.setgroups([])
+    os.setgid(pw.pw_gid)
+    os.setuid(pw.pw_uid)
 
 if __name__ == '__main__':
-    print(f"Server: http://localhost:{PORT}")
-    socketserver.TCPServer.allow_reuse_address = True
-    with socketserver.TCPServer(("0.0.0.0", PORT), Handler) as httpd:
+    with make_server() as httpd:
+        drop_privileges()
+        print(f"Server: http://localhost:{httpd.server_address[1]}")
         httpd.serve_forever()
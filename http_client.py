@@ -0,0 +1,81 @@
+"""
+Polymarket API 共享 HTTP 会话
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+from cache import FileCache, MARKET_CACHE, market_key
+from storage import loads
+
+logger = logging.getLogger(__name__)
+
+POOL_HOSTS = 4    # 缓存连接池的主机数
+POOL_SIZE = 64    # 每个主机保持的连接数，不小于并发查询数
+MAX_WORKERS = 16  # 并发查询数
+BATCH_SIZE = 100  # 每次请求查询的市场数
+
+
+def make_session() -> requests.Session:
+    """带连接池与重试的会话"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=POOL_HOSTS,
+        pool_maxsize=POOL_SIZE,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504])
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'User-Agent': 'Mozilla/5.0 (compatible; PolymarketScanner/1.0)',
+        'Accept-Encoding': 'gzip'
+    })
+    return session
+
+
+# 进程内共享，复用 keep-alive 连接
+SESSION = make_session()
+
+
+def get_markets(ids: Iterable[str], session: requests.Session = SESSION,
+                cache: Optional[FileCache] = MARKET_CACHE) -> Dict[str, Dict]:
+    """按 id 批量并发查询 Gamma 市场，返回 {id: market}；失败的批次记录日志后跳过
+
+    缓存命中的市场不再请求，查到的结果写回缓存。
+    """
+    markets = {}
+    missing = []
+    for mid in map(str, ids):
+        data = cache.get(market_key(mid)) if cache else None
+        if data is None:
+            missing.append(mid)
+        else:
+            markets[mid] = data
+    chunks = [missing[i:i + BATCH_SIZE] for i in range(0, len(missing), BATCH_SIZE)]
+    
+    def fetch(chunk):
+        response = session.get(
+            f"{config.GAMMA_API_URL}/markets",
+            # /markets 支持重复的 id 参数
+            params=[('id', mid) for mid in chunk] + [('limit', len(chunk))],
+            timeout=10
+        )
+        response.raise_for_status()
+        return loads(response.content)
+    
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        futures = {ex.submit(fetch, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            try:
+                for m in future.result():
+                    markets[str(m.get('id'))] = m
+                    if cache:
+                        cache.set(market_key(m.get('id')), m)
+            except Exception as e:
+                logger.error(f"批量查询失败 ({len(futures[future])} 个市场): {e}")
+    return markets
@@ -3,10 +3,10 @@ Polymarket 套利策略主程序
 每1小时扫描市场，执行符合条件的交易
 """
 import json
-import time
 import logging
 import signal
 import sys
+import threading
 from datetime import datetime, timezone
 from pathlib import Path
 
@@ -34,6 +34,7 @@ class ArbitrageBot:
         self.trader = VirtualTrader(config.VIRTUAL_BALANCE)
         self.recorder = TradeRecorder()
         self.running = True
+        self._stop = threading.Event()
         
         # 设置信号处理
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -43,6 +44,7 @@ class ArbitrageBot:
         """处理退出信号"""
         logger.info("收到退出信号，正在停止...")
         self.running = False
+        self._stop.set()
     
     def run_once(self) -> dict:
         """执行一次扫描和交易"""
@@ -50,10 +52,10 @@ class ArbitrageBot:
         logger.info(f"开始扫描 - {datetime.now(timezone.utc).isoformat()}")
         
         # 0. 检查待结算市场
-        settlement = self.scanner.check_settlements(config.DATA_DIR / "trades.json")
+        settlement = self.scanner.check_settlements(self.recorder.trades)
         if settlement.get('newly_resolved'):
             logger.info(f"📊 发现 {len(settlement['newly_resolved'])} 个新结算市场")
-            # TODO: 更新交易记录中的结算状态
+            self.recorder.record_settlements(settlement['newly_resolved'])
         
         logger.info(f"虚拟余额: ${self.trader.get_balance():.2f}")
         
@@ -98,21 +100,12 @@ class ArbitrageBot:
         
         # 3. 执行交易
         executed_trades = []
-        for market in markets:
-            # 检查余额
-            if self.trader.get_balance() < config.TRADE_AMOUNT:
-                logger.warning("余额不足，跳过交易")
-                break
-            
-            # 执行交易
-            executed = self.trader.execute_trade(market)
-            if executed:
-                executed_trades.append(executed.to_dict())
-                logger.info(f"✓ 执行交易: {executed.outcome} "
-                           f"${executed.amount} @ ${executed.price:.2f} "
-                           f"- {executed.question[:40]}...")
-            else:
-                logger.warning(f"✗ 交易失败: {market.question[:40]}...")
+        executed = self.trader.execute_trades(markets)
+        for trade in executed:
+            executed_trades.append(trade.to_dict())
+            logger.info(f"✓ 执行交易: {trade.outcome} "
+                       f"${trade.amount} @ ${trade.price:.2f} "
+                       f"- {trade.question[:40]}...")
         
         # 4. 记录结果
         balance_after = self.trader.get_balance()
@@ -162,10 +155,8 @@ class ArbitrageBot:
             
             # 等待下一次扫描
             logger.info(f"等待 {config.SCAN_INTERVAL} 秒...")
-            for _ in range(config.SCAN_INTERVAL):
-                if not self.running:
-                    break
-                time.sleep(1)
+            if self._stop.wait(config.SCAN_INTERVAL):
+                break
         
         logger.info("机器人已停止")
 
@@ -1,14 +1,20 @@
 """
 Polymarket 市场扫描器
 """
-import json
+import heapq
+import re
 import requests
 import logging
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Tuple
 from dataclasses import dataclass, asdict
+from functools import cached_property
+from operator import attrgetter
 import config
+from cache import MARKET_CACHE, market_key
+from http_client import SESSION, get_markets
+from storage import loads, unresolved_trades
 
 logging.basicConfig(
     level=logging.INFO,
@@ -21,9 +27,75 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def _keyword_pattern(keywords: List[str]) -> re.Pattern:
+    """关键词列表编译为一个正则，一次扫描匹配全部关键词 (长词在前)"""
+    alternation = '|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+    return re.compile(rf'\b(?:{alternation})\b', re.IGNORECASE)
+
+
+# crypto 相关市场 (按整词匹配，避免 "whether" 之类误中 "eth")
+_CRYPTO_RE = _keyword_pattern(config.CRYPTO_KEYWORDS)
+
+# Market 字段 <- API 原始字段: (属性名, 原始字段, 类型, 默认值)
+_MARKET_SCHEMA = (
+    ('id', 'id', 'str', ''),
+    ('question', 'question', 'str', ''),
+    ('end_date', 'endDate', 'str', ''),
+    ('outcome_prices', 'outcomePrices', 'json', None),
+    ('volume', 'volume', 'float', 0),
+    ('liquidity', 'liquidity', 'float', 0),
+    ('fee', 'fee', 'str', '0'),
+    ('clob_token_ids', 'clobTokenIds', 'json', None),
+    ('closed', 'closed', 'bool', None),
+    ('accepting_orders', 'acceptingOrders', 'bool', True),
+    ('start_date', 'startDate', 'str', ''),
+    ('created_at', 'createdAt', 'str', ''),
+)
+
+# parse_market 用到的原始字段
+_MARKET_FIELDS = tuple(key for _, key, _, _ in _MARKET_SCHEMA)
+
+# 各类型的取值表达式，生成解析函数时内联
+_COERCE = {
+    'str': 'get({key!r}, {default!r})',
+    'float': 'float(get({key!r}, {default!r}) or 0)',
+    'bool': 'parse_bool(get({key!r}, {default!r}))',
+    'json': 'parse_list(get({key!r}))',
+}
+
+
+def _parse_bool(val) -> bool:
+    """处理布尔值 (API 可能返回字符串 "true" 或布尔值)"""
+    if isinstance(val, bool):
+        return val
+    if isinstance(val, str):
+        return val.lower() == 'true'
+    return False
+
+
+def _parse_list(raw) -> list:
+    """解析 JSON 编码的列表字段 (如 outcomePrices)，失败返回空列表"""
+    if not raw:
+        return []
+    try:
+        return loads(raw)
+    except:
+        return []
+
+
+def _is_candidate(data: Dict) -> bool:
+    """只看原始字段的快速预筛 (未关闭、接受订单、交易量达标)，通过的才构造 Market"""
+    if _parse_bool(data.get('closed')) or not _parse_bool(data.get('acceptingOrders', True)):
+        return False
+    try:
+        return float(data.get('volume', 0) or 0) >= config.MIN_VOLUME
+    except (TypeError, ValueError):
+        return True  # 交给 parse_market 处理
+
+
 @dataclass
 class Market:
-    """市场数据"""
+    """市场数据 (价格与剩余时间等派生值首次访问时计算并缓存)"""
     id: str
     question: str
     end_date: str
@@ -37,39 +109,57 @@ class Market:
     start_date: str = ""  # 开始时间
     created_at: str = ""  # 创建时间
     
-    @property
+    @cached_property
     def yes_price(self) -> float:
         try:
             return float(self.outcome_prices[0]) if len(self.outcome_prices) > 0 else 0.0
         except:
             return 0.0
     
-    @property
+    @cached_property
     def no_price(self) -> float:
         try:
             return float(self.outcome_prices[1]) if len(self.outcome_prices) > 1 else 0.0
         except:
             return 0.0
     
-    @property
-    def hours_until_end(self) -> float:
+    @cached_property
+    def end_dt(self) -> Optional[datetime]:
+        """结束时间 (只解析一次)，无法解析时为 None"""
         try:
             end_str = self.end_date
             if not end_str:
-                return float('inf')
+                return None
             # 移除 Z 或 +00:00
             end_str = end_str.replace('Z', '').replace('+00:00', '')
             end = datetime.fromisoformat(end_str)
             # 如果没有时区信息，假设是 UTC
             if end.tzinfo is None:
                 end = end.replace(tzinfo=timezone.utc)
-            now = datetime.now(timezone.utc)
-            delta = end - now
-            return delta.total_seconds() / 3600
+            return end
         except:
+            return None
+    
+    def hours_until(self, now: datetime) -> float:
+        """距 now 的剩余小时数，结束时间未知时为 inf"""
+        end = self.end_dt
+        if end is None:
             return float('inf')
+        return (end - now).total_seconds() / 3600
     
-    @property
+    @cached_property
+    def hours_until_end(self) -> float:
+        return self.hours_until(datetime.now(timezone.utc))
+    
+    @cached_property
+    def fee_value(self) -> float:
+        """手续费数值，无法解析时视为 0"""
+        try:
+            return float(self.fee) if self.fee else 0.0
+        except:
+            return 0.0
+    
+    @cached_property
     def max_probability(self) -> float:
         try:
             return float(max(self.yes_price, self.no_price))
@@ -80,23 +170,37 @@ class Market:
     def high_probability_outcome(self) -> str:
         return "YES" if self.yes_price >= self.no_price else "NO"
     
-    @property
+    @cached_property
     def high_probability_price(self) -> float:
         return max(self.yes_price, self.no_price)
 
 
+def _compile_parser(schema) -> Callable[[Dict], Market]:
+    """按字段表生成专用的解析函数：所有 get 与类型转换内联，常用名字绑定为默认参数"""
+    args = ',\n        '.join(f"{attr}=" + _COERCE[kind].format(key=key, default=default)
+                              for attr, key, kind, default in schema)
+    src = ("def parse_row(data, Market=Market, parse_bool=parse_bool, parse_list=parse_list, float=float):\n"
+           "    get = data.get\n"
+           f"    return Market(\n        {args}\n    )\n")
+    namespace = {'Market': Market, 'parse_bool': _parse_bool, 'parse_list': _parse_list}
+    exec(src, namespace)
+    return namespace['parse_row']
+
+
+# 解析一行市场数据 (parse_market 的热路径)
+_parse_row = _compile_parser(_MARKET_SCHEMA)
+
+
 class MarketScanner:
     """市场扫描器"""
     
     def __init__(self):
         self.base_url = config.GAMMA_API_URL
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (compatible; PolymarketScanner/1.0)'
-        })
+        self.session = SESSION
+        self.cache = MARKET_CACHE
     
-    def fetch_markets(self, limit: int = 500) -> List[Dict]:
-        """获取市场列表 - 使用时间范围过滤"""
+    def fetch_markets(self, limit: int = 500) -> Tuple[List[Dict], int]:
+        """获取市场列表 - 使用时间范围过滤，返回 (过滤 crypto 后的市场, API 返回的原始行数)"""
         now = datetime.now(timezone.utc)
         
         params = {
@@ -105,6 +209,8 @@ class MarketScanner:
             # 使用 API 的 end_date 参数过滤最近结束的市场
             'end_date_min': now.isoformat(),
             'end_date_max': (now + timedelta(hours=config.MAX_HOURS_UNTIL_END)).isoformat(),
+            # 只取解析用到的字段；服务端不支持时会忽略该参数
+            'fields': ','.join(_MARKET_FIELDS),
         }
         
         try:
@@ -114,112 +220,78 @@ class MarketScanner:
                 timeout=30
             )
             response.raise_for_status()
-            markets = response.json()
+            markets = loads(response.content)
             
             # 客户端过滤：移除 crypto 相关市场
-            crypto_keywords = ['bitcoin', 'btc', 'ethereum', 'eth', 'solana', 'xrp', 'up or down']
-            filtered = []
-            for m in markets:
-                question = m.get('question', '').lower()
-                if not any(kw in question for kw in crypto_keywords):
-                    filtered.append(m)
+            filtered = [m for m in markets if not _CRYPTO_RE.search(m.get('question') or '')]
             
             logger.info(f"API返回 {len(markets)} 个市场，过滤crypto后 {len(filtered)} 个")
-            return filtered
+            return filtered, len(markets)
             
-        except requests.RequestException as e:
+        except (requests.RequestException, ValueError) as e:
             logger.error(f"获取市场列表失败: {e}")
-            return []
+            return [], 0
     
     def parse_market(self, data: Dict) -> Optional[Market]:
         """解析市场数据"""
         try:
-            # 解析价格
-            outcome_prices = []
-            if data.get('outcomePrices'):
-                try:
-                    outcome_prices = json.loads(data['outcomePrices'])
-                except:
-                    outcome_prices = []
-            
-            # 解析 token IDs
-            clob_token_ids = []
-            if data.get('clobTokenIds'):
-                try:
-                    clob_token_ids = json.loads(data['clobTokenIds'])
-                except:
-                    clob_token_ids = []
-            
-            # 处理布尔值 (API 可能返回字符串 "true" 或布尔值)
-            def parse_bool(val):
-                if isinstance(val, bool):
-                    return val
-                if isinstance(val, str):
-                    return val.lower() == 'true'
-                return False
-            
-            return Market(
-                id=data.get('id', ''),
-                question=data.get('question', ''),
-                end_date=data.get('endDate', ''),
-                outcome_prices=outcome_prices,
-                volume=float(data.get('volume', 0) or 0),
-                liquidity=float(data.get('liquidity', 0) or 0),
-                fee=data.get('fee', '0'),
-                clob_token_ids=clob_token_ids,
-                closed=parse_bool(data.get('closed')),
-                accepting_orders=parse_bool(data.get('acceptingOrders', True)),
-                start_date=data.get('startDate', ''),
-                created_at=data.get('createdAt', '')
-            )
+            return _parse_row(data)
         except Exception as e:
             logger.warning(f"解析市场数据失败: {e}")
             return None
     
-    def filter_markets(self, markets: List[Market]) -> List[Market]:
-        """筛选符合条件的市场"""
+    def filter_markets(self, markets: List[Market], now: datetime = None) -> List[Market]:
+        """筛选符合条件的市场 (剩余时间统一按同一个 now 计算)"""
+        if now is None:
+            now = datetime.now(timezone.utc)
         filtered = []
+        debug = logger.isEnabledFor(logging.DEBUG)
         
         for market in markets:
             # 0. 检查市场是否已关闭或不再接受订单
             if market.closed or not market.accepting_orders:
                 continue
             
-            # 0. 检查市场是否已经结束
-            if market.hours_until_end <= 0:
+            # 先做便宜的数值比较，再算概率与剩余时间
+            # 1. 检查交易量
+            if market.volume < config.MIN_VOLUME:
                 continue
             
-            # 1. 检查结束时间 <= 30天
-            if market.hours_until_end > config.MAX_HOURS_UNTIL_END:
+            # 2. 检查手续费
+            if market.fee_value > config.MAX_FEE:
                 continue
             
-            # 2. 检查概率在 95-98% 之间
-            if market.max_probability < config.MIN_PROBABILITY:
+            # 3. 检查概率在 95-98% 之间
+            probability = market.max_probability
+            if probability < config.MIN_PROBABILITY:
                 continue
-            if market.max_probability > config.MAX_PROBABILITY:
+            if probability > config.MAX_PROBABILITY:
                 continue
             
-            # 3. 检查手续费
-            try:
-                fee = float(market.fee) if market.fee else 0
-                if fee > config.MAX_FEE:
-                    continue
-            except:
-                pass
-            
-            # 4. 检查交易量
-            if market.volume < config.MIN_VOLUME:
+            # 4. 检查市场未结束且在 MAX_HOURS_UNTIL_END 内结束
+            hours = market.hours_until(now)
+            if hours <= 0:
+                continue
+            if hours > config.MAX_HOURS_UNTIL_END:
                 continue
             
             filtered.append(market)
-            logger.info(f"符合条件: {market.question[:50]}... "
-                       f"概率: {market.max_probability:.1%}, "
-                       f"结束: {market.hours_until_end:.1f}小时后")
+            if debug:
+                logger.debug(f"符合条件: {market.question[:50]}... "
+                            f"概率: {probability:.1%}, "
+                            f"结束: {hours:.1f}小时后")
         
         # 排序：优先选择价格更低的（即概率更接近95%的，风险/收益比更好）
-        filtered.sort(key=lambda m: m.high_probability_price)
+        # 只需前几个，用堆取最小的 K 个，不必整体排序 (结果与稳定排序后切片一致)
+        selected = heapq.nsmallest(config.MAX_TRADES_PER_RUN, filtered,
+                                   key=attrgetter('high_probability_price'))
         
-        return filtered[:config.MAX_TRADES_PER_RUN]
+        # 只为选中的市场汇总输出一条日志
+        logger.info(f"符合条件 {len(filtered)} 个，选中 {len(selected)} 个" + ''.join(
+            f"\n  {m.question[:50]}... 概率: {m.max_probability:.1%}, 结束: {m.hours_until(now):.1f}小时后"
+            for m in selected))
+        
+        return selected
     
     def scan(self) -> tuple:
         """扫描市场 - 返回 (filtered_markets, stats)"""
@@ -227,22 +299,23 @@ class MarketScanner:
         logger.info("开始扫描市场...")
         
         # 获取市场数据
-        markets_data = self.fetch_markets()
-        total_api = len(markets_data)
+        markets_data, total_api = self.fetch_markets()
         logger.info(f"API返回 {total_api} 个市场")
         
-        # 解析市场
+        # 解析市场：先按原始字段预筛，只为候选行构造 Market
         markets = []
         for data in markets_data:
+            if not _is_candidate(data):
+                continue
             market = self.parse_market(data)
             if market:
                 markets.append(market)
         
-        logger.info(f"成功解析 {len(markets)} 个市场")
+        logger.info(f"预筛后成功解析 {len(markets)} 个市场")
         
         # 筛选
         filtered = self.filter_markets(markets)
-        non_crypto_count = len(markets)  # 过滤crypto后的数量（在fetch_markets里已经过滤了）
+        non_crypto_count = len(markets_data)  # 过滤crypto后的数量（在fetch_markets里已经过滤了）
         
         stats = {
             'total_api': total_api,
@@ -256,74 +329,60 @@ class MarketScanner:
         return filtered[:config.MAX_TRADES_PER_RUN], stats
     
     def get_market_detail(self, market_id: str) -> Optional[Dict]:
-        """获取市场详情"""
+        """获取市场详情 (优先读缓存)"""
+        cached = self.cache.get(market_key(market_id))
+        if cached is not None:
+            return cached
         try:
             response = self.session.get(
                 f"{self.base_url}/markets/{market_id}",
                 timeout=30
             )
             response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
+            market = loads(response.content)
+            self.cache.set(market_key(market_id), market)
+            return market
+        except (requests.RequestException, ValueError) as e:
             logger.error(f"获取市场详情失败: {e}")
             return None
     
-    def check_settlements(self, trades_file: Path) -> dict:
-        """检查待结算市场的结算状态"""
-        import config
-        
-        if not trades_file.exists():
-            return {'resolved': [], 'unresolved': [], 'newly_resolved': []}
-        
-        with open(trades_file, 'r') as f:
-            data = json.load(f)
-        
-        # 收集所有未结算的交易
-        all_trades = []
-        for run in data.get('runs', []):
-            for t in run.get('executed_trades', []):
-                if not t.get('settled'):
-                    all_trades.append(t)
-        
-        if not all_trades:
+    def check_settlements(self, data: Dict) -> dict:
+        """检查待结算市场的结算状态 (data 为 TradeRecorder.trades 或 load_trades 的结果)"""
+        # 未结算交易 (按 market_id 去重)，有索引时直接读索引
+        unique_markets = unresolved_trades(data)
+        if not unique_markets:
             return {'resolved': [], 'unresolved': [], 'newly_resolved': []}
         
-        # 去重
-        unique_markets = {}
-        for t in all_trades:
-            mid = t.get('market_id')
-            if mid and mid not in unique_markets:
-                unique_markets[mid] = t
-        
         resolved = []
         unresolved = []
         newly_resolved = []
         
-        # 逐个查询
+        # 按批并发查询
+        markets = get_markets(unique_markets, self.session, self.cache)
+        
         for mid, trade in unique_markets.items():
-            try:
-                response = self.session.get(f"{self.base_url}/markets/{mid}", timeout=10)
-                market = response.json()
-                
-                is_closed = market.get('closed', False)
-                resolution = market.get('resolution')
-                
-                if is_closed and resolution and str(resolution) != 'null':
-                    result = {**trade, 'resolution': resolution, 'settled': True}
-                    resolved.append(result)
-                    if not trade.get('settled'):
-                        newly_resolved.append(result)
-                        logger.info(f"✅ 已结算: {trade.get('question')[:40]} → {resolution}")
-                elif is_closed:
-                    result = {**trade, 'resolution': 'CANCELLED', 'settled': True}
-                    resolved.append(result)
-                    if not trade.get('settled'):
-                        newly_resolved.append(result)
-                        logger.info(f"❌ 已关闭: {trade.get('question')[:40]}")
-                else:
-                    unresolved.append(trade)
-            except Exception as e:
-                logger.error(f"查询失败 {mid}: {e}")
+            market = markets.get(str(mid))
+            if market is None:
+                logger.error(f"查询失败 {mid}: 未返回市场数据")
+                unresolved.append(trade)
+                continue
+            
+            is_closed = market.get('closed', False)
+            resolution = market.get('resolution')
+            
+            if is_closed and resolution and str(resolution) != 'null':
+                result = {**trade, 'resolution': resolution, 'settled': True}
+                resolved.append(result)
+                if not trade.get('settled'):
+                    newly_resolved.append(result)
+                    logger.info(f"✅ 已结算: {trade.get('question')[:40]} → {resolution}")
+            elif is_closed:
+                result = {**trade, 'resolution': 'CANCELLED', 'settled': True}
+                resolved.append(result)
+                if not trade.get('settled'):
+                    newly_resolved.append(result)
+                    logger.info(f"❌ 已关闭: {trade.get('question')[:40]}")
+            else:
                 unresolved.append(trade)
         
         return {'resolved': resolved, 'unresolved': unresolved, 'newly_resolved': newly_resolved}
@@ -0,0 +1,296 @@
+"""
+Polymarket 交易记录存储与统计
+"""
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Optional, Set, Tuple
+
+try:
+    import orjson  # 可选依赖，解析速度更快
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+SUM_KEYS = ('total_invested', 'pending_cost', 'cancelled_cost', 'pending_payout', 'actual_profit')
+BUCKETS = ('pending', 'settled', 'cancelled')
+
+
+def loads(raw):
+    """解析 JSON 字节或字符串；解析失败抛出 ValueError"""
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+
+def load_json(path: Path):
+    """读取 JSON 文件"""
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def dump_json(obj, indent: bool = True) -> bytes:
+    """序列化为 UTF-8 字节；indent=False 时输出单行 (用于 NDJSON)"""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def write_json_atomic(path: Path, obj, indent: bool = True, fsync: bool = False):
+    """先写临时文件再 os.replace，读者不会看到写了一半的文件
+
+    fsync=True 时替换前先刷到磁盘，断电也不会丢失；默认不刷，写入更快。
+    """
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(dump_json(obj, indent))
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class RunLog:
+    """追加写入的运行记录 (每行一条 JSON)
+
+    普通行是一次运行记录；{"settlements": [...]} 行把之前运行中的交易标记为已结算。
+    refresh() 只解析上次读取位置之后新增的完整行。
+    """
+
+    def __init__(self, path: Path, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self.runs: List[Dict] = []
+        self.offset = 0
+
+    def refresh(self) -> Tuple[int, Set[int]]:
+        """读取新增行，返回 (第一条新运行的下标, 被结算事件修改的运行下标)"""
+        size = self.path.stat().st_size if self.path.exists() else 0
+        if size < self.offset:
+            # 文件被截断或替换，从头读
+            self.runs, self.offset = [], 0
+        first_new = len(self.runs)
+        changed = set()
+        if size == self.offset:
+            return first_new, changed
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read(size - self.offset)
+        end = chunk.rfind(b'\n') + 1  # 末尾未写完的行留到下次
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                changed.update(self.apply(loads(line)))
+            except (ValueError, TypeError, KeyError, IndexError) as e:
+                # 损坏的行 (如写了一半后又被追加) 跳过，不影响其余记录
+                logger.warning(f"跳过无法解析的记录 {self.path.name}: {e}")
+        self.offset += end
+        return first_new, changed
+
+    def apply(self, record: Dict) -> Set[int]:
+        """把一行记录应用到内存，返回被修改的旧运行下标"""
+        if 'settlements' not in record:
+            if 'sums' not in record:
+                summarize_run(record)
+            self.runs.append(record)
+            return set()
+        for s in record['settlements']:
+            settle_trade(None, self.runs[s['run_idx']], s['trade_idx'], s['resolution'])
+        return {s['run_idx'] for s in record['settlements']}
+
+    def write(self, *records: Dict):
+        """追加记录；只负责落盘，调用方自行更新内存中的 runs"""
+        lines = b''.join(dump_json(r, indent=False) + b'\n' for r in records)
+        size = self.path.stat().st_size if self.path.exists() else 0
+        with open(self.path, 'ab') as f:
+            if size > self.offset:
+                with open(self.path, 'rb') as r:
+                    r.seek(self.offset)
+                    tail = r.read()
+                if b'\n' not in tail:
+                    # 末尾是上次没写完的行，截掉再追加
+                    logger.warning(f"截断 {self.path.name} 末尾未写完的 {len(tail)} 字节")
+                    f.truncate(self.offset)
+                    size = self.offset
+                elif not tail.endswith(b'\n'):
+                    # 另有未读取的新行，只保证新记录从行首开始
+                    lines = b'\n' + lines
+            f.write(lines)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if size == self.offset:
+            self.offset += len(lines)
+
+
+def load_state(path: Path) -> Dict:
+    """读取统计文件；不存在或已损坏时返回空 dict (由调用方重建)"""
+    try:
+        return load_json(path)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_trades(log_path: Path, state_path: Path, legacy_path: Optional[Path] = None) -> Dict:
+    """一次性读取全部记录: {'runs': [...], 'aggregate': ..., 'unresolved_index': ..., ...}
+
+    运行日志不存在时回退到旧版单文件 trades.json。
+    """
+    if not log_path.exists():
+        if legacy_path and legacy_path.exists():
+            return load_json(legacy_path)
+        return {'runs': []}
+    log = RunLog(log_path)
+    log.refresh()
+    data = load_state(state_path)
+    data['runs'] = log.runs
+    return data
+
+
+def format_local_time(timestamp: str) -> str:
+    """ISO 时间戳转为页面显示格式"""
+    try:
+        dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        return dt.strftime('%Y-%m-%d %H:%M:%S')
+    except:
+        return timestamp
+
+
+def is_win(outcome: str, resolution: str) -> bool:
+    """买入方向是否与结算结果一致"""
+    return (outcome == 'YES' and resolution == 'Yes') or (outcome == 'NO' and resolution == 'No')
+
+
+def trade_bucket(t: Dict) -> str:
+    """交易所属分类: pending / cancelled / settled"""
+    if not t.get('settled'):
+        return 'pending'
+    if t.get('resolution') == 'CANCELLED':
+        return 'cancelled'
+    return 'settled'
+
+
+def empty_sums() -> Dict:
+    return {k: 0.0 for k in SUM_KEYS}
+
+
+def empty_aggregate() -> Dict:
+    """累计统计初始值"""
+    aggregate = empty_sums()
+    aggregate['counts'] = {'runs': 0, 'trades': 0, 'pending': 0, 'settled': 0, 'cancelled': 0}
+    return aggregate
+
+
+def add_trade(sums: Dict, t: Dict, sign: int = 1) -> str:
+    """按交易当前状态累加 (sign=1) 或扣除 (sign=-1) 其金额，返回所属分类"""
+    cost = t.get('cost', 0)
+    bucket = trade_bucket(t)
+    sums['total_invested'] += sign * cost
+    if bucket == 'pending':
+        sums['pending_cost'] += sign * cost
+        sums['pending_payout'] += sign * t.get('amount', 0)  # 股数
+    elif bucket == 'cancelled':
+        sums['cancelled_cost'] += sign * cost
+    else:
+        sums['actual_profit'] += sign * max(t.get('profit', 0), 0)
+    return bucket
+
+
+def apply_trade(aggregate: Dict, t: Dict, sign: int = 1):
+    """同 add_trade，并更新分类计数"""
+    bucket = add_trade(aggregate, t, sign)
+    aggregate['counts'][bucket] += sign
+    aggregate['counts']['trades'] += sign
+
+
+def summarize_run(run: Dict):
+    """一次遍历生成该次运行的分类索引 (buckets) 与金额汇总 (sums)"""
+    sums = empty_sums()
+    buckets = {f'{b}_idx': [] for b in BUCKETS}
+    for i, t in enumerate(run.get('executed_trades', [])):
+        buckets[f'{add_trade(sums, t)}_idx'].append(i)
+    run['sums'] = sums
+    run['buckets'] = buckets
+
+
+def build_aggregate(runs: List[Dict]) -> Dict:
+    """按每次运行的汇总计算累计统计"""
+    aggregate = empty_aggregate()
+    counts = aggregate['counts']
+    counts['runs'] = len(runs)
+    for run in runs:
+        if 'sums' not in run:
+            summarize_run(run)
+        sums = run['sums']
+        for k in SUM_KEYS:
+            aggregate[k] += sums[k]
+        for b in BUCKETS:
+            n = len(run['buckets'][f'{b}_idx'])
+            counts[b] += n
+            counts['trades'] += n
+    return aggregate
+
+
+def index_run(index: Dict, run_idx: int, run: Dict):
+    """把该次运行的待结算交易登记到 market_id 索引"""
+    trades = run.get('executed_trades', [])
+    for i in run['buckets']['pending_idx']:
+        mid = trades[i].get('market_id')
+        if mid:
+            index.setdefault(mid, []).append({'run_idx': run_idx, 'trade_idx': i})
+
+
+def build_unresolved_index(runs: List[Dict]) -> Dict:
+    """market_id -> 待结算交易位置列表"""
+    index = {}
+    for run_idx, run in enumerate(runs):
+        if 'buckets' not in run:
+            summarize_run(run)
+        index_run(index, run_idx, run)
+    return index
+
+
+def unresolved_trades(data: Dict) -> Dict:
+    """market_id -> 该市场第一笔待结算交易"""
+    runs = data.get('runs', [])
+    index = data.get('unresolved_index')
+    if index is None:
+        index = build_unresolved_index(runs)
+    return {
+        mid: runs[locs[0]['run_idx']]['executed_trades'][locs[0]['trade_idx']]
+        for mid, locs in index.items()
+    }
+
+
+def settle_trade(aggregate: Optional[Dict], run: Dict, idx: int, resolution: str) -> bool:
+    """将一笔待结算交易标记为已结算，同步更新运行汇总与累计统计 (aggregate 可为 None)
+
+    交易已结算时不做改动，返回 False。
+    """
+    t = run['executed_trades'][idx]
+    if t.get('settled'):
+        return False
+    add_trade(run['sums'], t, -1)
+    if aggregate is not None:
+        apply_trade(aggregate, t, -1)
+
+    t['settled'] = True
+    t['resolution'] = resolution
+    if resolution == 'CANCELLED':
+        t['profit'] = 0.0
+    elif is_win(t.get('outcome'), resolution):
+        t['profit'] = t.get('amount', 0) - t.get('cost', 0)
+    else:
+        t['profit'] = -t.get('cost', 0)
+
+    buckets = run['buckets']
+    buckets['pending_idx'].remove(idx)
+    buckets[f'{add_trade(run["sums"], t)}_idx'].append(idx)
+    if aggregate is not None:
+        apply_trade(aggregate, t)
+    return True
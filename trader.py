@@ -1,16 +1,17 @@
 """
 Polymarket 交易模拟器
 """
-import json
 import uuid
 from datetime import datetime, timezone
 from typing import List, Dict, Optional
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from scanner import Market, MarketScanner
+from storage import (RunLog, load_json, load_state, write_json_atomic, summarize_run,
+                     build_aggregate, apply_trade, settle_trade, index_run, build_unresolved_index)
 import config
 
 
-@dataclass
+@dataclass(slots=True)
 class PlannedTrade:
     """计划交易"""
     market_id: str
@@ -21,10 +22,17 @@ class PlannedTrade:
     reason: str
     
     def to_dict(self):
-        return asdict(self)
+        return {
+            'market_id': self.market_id,
+            'question': self.question,
+            'outcome': self.outcome,
+            'price': self.price,
+            'amount': self.amount,
+            'reason': self.reason
+        }
 
 
-@dataclass
+@dataclass(slots=True)
 class ExecutedTrade:
     """已执行交易"""
     market_id: str
@@ -40,7 +48,19 @@ class ExecutedTrade:
     created_at: str = ""  # 市场创建时间
     
     def to_dict(self):
-        return asdict(self)
+        return {
+            'market_id': self.market_id,
+            'question': self.question,
+            'outcome': self.outcome,
+            'price': self.price,
+            'amount': self.amount,
+            'cost': self.cost,
+            'timestamp': self.timestamp,
+            'status': self.status,
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'created_at': self.created_at
+        }
 
 
 class VirtualTrader:
@@ -68,8 +88,11 @@ class VirtualTrader:
             # 买入 NO，正确则获得 (1 - price) × amount
             return trade.amount * (1.0 - trade.price)
     
-    def execute_trade(self, market: Market, amount: float = None) -> Optional[ExecutedTrade]:
+    def execute_trade(self, market: Market, amount: float = None,
+                      timestamp: str = None) -> Optional[ExecutedTrade]:
         """执行交易（虚拟）"""
+        if timestamp is None:
+            timestamp = datetime.now(timezone.utc).isoformat()
         if amount is None:
             amount = config.TRADE_AMOUNT
         
@@ -104,7 +127,7 @@ class VirtualTrader:
             price=price,
             amount=shares,  # 股数
             cost=cost,      # 实际花费
-            timestamp=datetime.now(timezone.utc).isoformat(),
+            timestamp=timestamp,
             status="simulated",
             start_date=market.start_date,
             end_date=market.end_date,
@@ -131,6 +154,23 @@ class VirtualTrader:
         
         return trade
     
+    def execute_trades(self, markets: List[Market], amount: float = None) -> List[ExecutedTrade]:
+        """按顺序批量执行交易，同一批共用一个时间戳；余额低于 TRADE_AMOUNT 时停止"""
+        timestamp = datetime.now(timezone.utc).isoformat()
+        executed = []
+        for market in markets:
+            # 检查余额
+            if self.balance < config.TRADE_AMOUNT:
+                logger.warning("余额不足，跳过交易")
+                break
+            
+            trade = self.execute_trade(market, amount, timestamp)
+            if trade:
+                executed.append(trade)
+            else:
+                logger.warning(f"✗ 交易失败: {market.question[:40]}...")
+        return executed
+    
     def get_balance(self) -> float:
         return self.balance
     
@@ -147,57 +187,124 @@ class VirtualTrader:
 class TradeRecorder:
     """交易记录器"""
     
-    def __init__(self, filepath=config.TRADES_FILE):
-        self.filepath = filepath
+    def __init__(self, log_path=config.TRADES_LOG, state_path=config.AGGREGATE_FILE,
+                 legacy_path=config.TRADES_FILE):
+        self.log_path = log_path
+        self.state_path = state_path
+        self.legacy_path = legacy_path
+        self.log = RunLog(log_path, fsync=config.FSYNC_WRITES)
         self.trades = self._load()
     
     def _load(self) -> Dict:
         """加载历史记录"""
-        if self.filepath.exists():
-            try:
-                with open(self.filepath, 'r') as f:
-                    return json.load(f)
-            except:
-                pass
-        return {
-            'runs': [],
-            'total_invested': 0,
-            'total_payout': 0,
-            'win_count': 0,
-            'loss_count': 0
-        }
+        if not self.log_path.exists() and self.legacy_path.exists():
+            self._migrate()
+        self.log.refresh()
+        runs = self.log.runs
+        
+        trades = load_state(self.state_path)
+        trades.pop('settled_ids', None)  # 旧版字段，已由 unresolved_index 取代
+        for key in ('total_invested', 'total_payout', 'win_count', 'loss_count'):
+            trades.setdefault(key, 0)
+        
+        # 统计文件缺失或与运行日志不一致时重建 (如追加日志后、保存统计前进程退出)
+        aggregate = trades.get('aggregate')
+        stale = (not aggregate or aggregate['counts']['runs'] != len(runs)
+                 or trades.get('log_offset') != self.log.offset or 'unresolved_index' not in trades)
+        if stale:
+            trades['aggregate'] = build_aggregate(runs)
+            trades['unresolved_index'] = build_unresolved_index(runs)
+        
+        trades['runs'] = runs
+        if stale:
+            self._save(trades)
+        return trades
     
-    def _save(self):
-        """保存记录"""
-        with open(self.filepath, 'w') as f:
-            json.dump(self.trades, f, indent=2, ensure_ascii=False)
+    def _migrate(self):
+        """把旧版 trades.json 拆成运行日志 + 统计文件"""
+        try:
+            legacy = load_json(self.legacy_path)
+        except:
+            return
+        runs = legacy.pop('runs', [])
+        for run in runs:
+            if 'sums' not in run:
+                summarize_run(run)
+        self.log.write(*runs)
+        self.log.runs.extend(runs)
+        write_json_atomic(self.state_path, legacy, indent=False, fsync=config.FSYNC_WRITES)
+        logger.info(f"已迁移 {len(runs)} 条运行记录到 {self.log_path.name}")
+    
+    def _save(self, trades: Dict = None):
+        """保存统计 (运行记录已追加写入日志)；每次运行都会重写，用紧凑格式
+
+        log_offset 记录统计对应的日志位置，加载时不一致即重建。
+        """
+        trades = self.trades if trades is None else trades
+        state = {k: v for k, v in trades.items() if k != 'runs'}
+        state['log_offset'] = self.log.offset
+        write_json_atomic(self.state_path, state, indent=False, fsync=config.FSYNC_WRITES)
     
     def record_run(self, run_data: Dict):
         """记录一次运行"""
         run_id = str(uuid.uuid4())[:8]
+        now = datetime.now(timezone.utc)
         
         run_record = {
             'run_id': run_id,
-            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'timestamp': now.isoformat(),
+            'local_time': now.strftime('%Y-%m-%d %H:%M:%S'),
             'virtual_balance_before': run_data.get('balance_before', 0),
             'planned_trades': run_data.get('planned_trades', []),
             'executed_trades': run_data.get('executed_trades', []),
             'scan_info': run_data.get('scan_info', {}),
             'summary': run_data.get('summary', {})
         }
+        summarize_run(run_record)
         
+        self.log.write(run_record)
         self.trades['runs'].append(run_record)
+        index_run(self.trades['unresolved_index'], len(self.trades['runs']) - 1, run_record)
         
         # 更新统计
         executed = run_data.get('executed_trades', [])
         if executed:
             self.trades['total_invested'] += sum(t['amount'] for t in executed)
+        aggregate = self.trades['aggregate']
+        aggregate['counts']['runs'] += 1
+        for t in executed:
+            apply_trade(aggregate, t)
         
         self._save()
         
         logger.info(f"Run {run_id} 已记录")
         return run_id
     
+    def record_settlements(self, results: List[Dict]) -> int:
+        """写回结算结果，返回更新的交易笔数"""
+        resolutions = {r['market_id']: r['resolution'] for r in results if r.get('market_id')}
+        if not resolutions:
+            return 0
+        
+        aggregate = self.trades['aggregate']
+        index = self.trades['unresolved_index']
+        runs = self.trades['runs']
+        events = []
+        for mid, resolution in resolutions.items():
+            locs = index.pop(mid, None)
+            if locs is None:
+                continue
+            for loc in locs:
+                if settle_trade(aggregate, runs[loc['run_idx']], loc['trade_idx'], resolution):
+                    events.append({**loc, 'resolution': resolution})
+        
+        updated = len(events)
+        if updated:
+            self.log.write({'settlements': events})
+            self._save()
+            logger.info(f"已写回 {updated} 笔结算")
+        return updated
+    
     def get_stats(self) -> Dict:
         """获取统计信息"""
         return {